@@ -1,6 +1,12 @@
+import os
+import threading
+from collections import OrderedDict
+
 from flask import Flask, request, jsonify
 import pandas as pd
 
+from scriptdiff import CHANGE_TYPES, diff_snapshots, split_snapshots
+
 app = Flask(__name__)
 
 ###########################################
@@ -10,16 +16,7 @@ app = Flask(__name__)
 # Lecture du fichier CSV (assurez-vous que le fichier 'all_products_cleaned.csv' se trouve dans le même répertoire)
 # Le CSV doit contenir les colonnes suivantes en entête : 
 # Nom,Prix,Site web,Catégorie,Date de collecte,Promotions
-df = pd.read_csv('all_products_cleaned.csv')
-
-# Nettoyage de la colonne 'Prix'
-# - Suppression du texte " MAD"
-# - Remplacement de la virgule par un point (si nécessaire)
-df['Prix'] = (df['Prix']
-              .str.replace(' MAD', '', regex=False)
-              .str.replace('MAD', '', regex=False)
-              .str.replace(',', '.', regex=False))
-df['Prix'] = pd.to_numeric(df['Prix'], errors='coerce')
+DATA_FILE = 'all_products_cleaned.csv'
 
 # Fonction de conversion pour la colonne 'Promotions'
 def convert_discount(val):
@@ -32,11 +29,132 @@ def convert_discount(val):
     except Exception:
         return 0.0
 
-# Création d'une colonne numérique 'Discount' pour faciliter le filtrage
-df['Discount'] = df['Promotions'].apply(convert_discount)
+def load_data(filename):
+    """
+    Lit et nettoie le fichier CSV des produits.
+    """
+    data = pd.read_csv(filename)
+
+    # Nettoyage de la colonne 'Prix'
+    # - Suppression du texte " MAD"
+    # - Remplacement de la virgule par un point (si nécessaire)
+    data['Prix'] = (data['Prix']
+                    .str.replace(' MAD', '', regex=False)
+                    .str.replace('MAD', '', regex=False)
+                    .str.replace(',', '.', regex=False))
+    data['Prix'] = pd.to_numeric(data['Prix'], errors='coerce')
+
+    # Création d'une colonne numérique 'Discount' pour faciliter le filtrage
+    data['Discount'] = data['Promotions'].apply(convert_discount)
+
+    # Conversion de la colonne 'Date de collecte' en type datetime
+    data['Date de collecte'] = pd.to_datetime(data['Date de collecte'], format='%Y-%m-%d', errors='coerce')
+    return data
+
+def get_data_version(filename):
+    """
+    Version du jeu de données : date de modification et taille du fichier CSV.
+    Elle change dès que le fichier est régénéré (nouvelle collecte, nouveau nettoyage).
+    """
+    stat = os.stat(filename)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+df = load_data(DATA_FILE)
+data_version = get_data_version(DATA_FILE)
+failed_version = None  # Dernière version du fichier qui n'a pas pu être chargée
+
+###########################################
+# Cache des agrégations
+###########################################
+
+STATS_CACHE_MAX_ENTRIES = 128     # Nombre maximum de requêtes mémorisées
+STATS_CACHE_MAX_ROWS = 100000     # Nombre maximum de lignes de résultat mémorisées au total
+
+class LRUCache:
+    """
+    Cache LRU (moins récemment utilisé) limité en nombre d'entrées et en nombre
+    total de lignes de résultat. Les entrées les plus anciennes sont évincées en premier.
+    """
+
+    def __init__(self, max_entries=STATS_CACHE_MAX_ENTRIES, max_rows=STATS_CACHE_MAX_ROWS):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.entries = OrderedDict()
+        self.total_rows = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+
+    def put(self, key, rows, size=None):
+        """
+        Mémorise un résultat. `size` est son nombre de lignes (len(rows) par défaut).
+        """
+        if size is None:
+            size = len(rows)
+        with self.lock:
+            if size > self.max_rows:
+                return  # Résultat trop volumineux pour être mémorisé
+            if key in self.entries:
+                self.total_rows -= self.entries.pop(key)[1]
+            self.entries[key] = (rows, size)
+            self.total_rows += size
+            while len(self.entries) > self.max_entries or self.total_rows > self.max_rows:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.total_rows -= evicted_size
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_rows = 0
 
-# Conversion de la colonne 'Date de collecte' en type datetime
-df['Date de collecte'] = pd.to_datetime(df['Date de collecte'], format='%Y-%m-%d', errors='coerce')
+stats_cache = LRUCache()
+changes_cache = LRUCache()
+
+# Un seul rechargement à la fois lorsque plusieurs requêtes arrivent en parallèle
+data_lock = threading.Lock()
+
+@app.before_request
+def refresh_data():
+    """
+    Recharge les données si le fichier CSV a changé depuis le dernier chargement,
+    et vide alors les caches des agrégations et des changements.
+    Si le fichier ne peut pas être lu (par exemple pendant sa réécriture par
+    scriptnettoyage.py), on continue de servir les données précédentes et cette
+    version du fichier n'est plus relue tant qu'il n'est pas modifié à nouveau.
+    """
+    global df, data_version, failed_version
+    try:
+        if get_data_version(DATA_FILE) in (data_version, failed_version):
+            return
+    except OSError:
+        return
+
+    with data_lock:
+        current_version = None
+        try:
+            current_version = get_data_version(DATA_FILE)
+            if current_version in (data_version, failed_version):
+                return  # Déjà traité par une autre requête
+            new_df = load_data(DATA_FILE)
+            # Fichier modifié pendant la lecture : nouvelle tentative à la prochaine requête
+            if get_data_version(DATA_FILE) != current_version:
+                return
+        except Exception as e:
+            app.logger.warning(f"Rechargement de {DATA_FILE} impossible, données précédentes conservées : {e}")
+            if current_version is not None:
+                failed_version = current_version
+            return
+        # df est remplacé avant data_version : un endpoint qui lit data_version puis df
+        # ne peut pas mémoriser d'anciennes données sous la nouvelle version.
+        df = new_df
+        data_version = current_version
+        stats_cache.clear()
+        changes_cache.clear()
 
 ###########################################
 # Endpoints de l'API
@@ -94,6 +212,160 @@ def get_promotions_by_category():
     return jsonify(promo_dict)
 
 
+@app.route('/changes', methods=['GET'])
+def get_changes():
+    """
+    Liste les changements entre deux collectes : baisses et hausses de prix,
+    nouvelles promotions, promotions terminées, produits apparus ou disparus.
+    Paramètres GET optionnels :
+      - from, to : dates de collecte à comparer (YYYY-MM-DD). Par défaut, les deux dernières collectes.
+      - type : ne renvoyer qu'un type de changement (ex. "price_drops").
+    Les résultats sont mis en cache jusqu'au prochain changement du fichier de données.
+    """
+    # Lecture unique des globales (data_version d'abord, voir refresh_data)
+    version = data_version
+    data = df
+
+    dates = sorted(pd.Series(data['Date de collecte'].dropna().unique()).dt.strftime('%Y-%m-%d'))
+    if len(dates) < 2:
+        return jsonify({'error': 'Au moins deux collectes sont nécessaires.'}), 404
+
+    date_to = request.args.get('to', default=dates[-1], type=str)
+    if date_to not in dates:
+        return jsonify({'error': f'Collecte du "{date_to}" non trouvée.'}), 404
+    # Par défaut, on compare à la collecte précédant la date "to"
+    date_from = request.args.get('from', default=None, type=str)
+    if date_from is None:
+        previous_dates = [date for date in dates if date < date_to]
+        if not previous_dates:
+            return jsonify({'error': f'Aucune collecte antérieure au "{date_to}".'}), 404
+        date_from = previous_dates[-1]
+    if date_from not in dates:
+        return jsonify({'error': f'Collecte du "{date_from}" non trouvée.'}), 404
+    if date_from >= date_to:
+        return jsonify({'error': f'La date "from" ({date_from}) doit être antérieure à la date "to" ({date_to}).'}), 400
+
+    change_type = request.args.get('type', default=None, type=str)
+    if change_type is not None and change_type not in CHANGE_TYPES:
+        return jsonify({'error': f'Le paramètre "type" doit être parmi : {", ".join(CHANGE_TYPES)}.'}), 400
+
+    key = (version, date_from, date_to)
+    changes = changes_cache.get(key)
+    if changes is None:
+        # Seules les deux collectes comparées sont converties : le coût ne dépend
+        # que de leur taille, pas de tout l'historique
+        selected = data[data['Date de collecte'].isin(pd.to_datetime([date_from, date_to]))]
+        records = selected.assign(**{'Date de collecte': selected['Date de collecte'].dt.strftime('%Y-%m-%d')}).to_dict('records')
+        snapshots = split_snapshots(records)
+        changes = diff_snapshots(snapshots[date_from], snapshots[date_to])
+        changes_cache.put(key, changes, size=sum(len(value) for value in changes.values()))
+
+    if change_type is not None:
+        changes = {change_type: changes[change_type]}
+
+    return jsonify({
+        'from': date_from,
+        'to': date_to,
+        'counts': {key: len(value) for key, value in changes.items()},
+        'changes': changes,
+    })
+
+
+# Dimensions de regroupement acceptées par /stats et colonnes correspondantes
+STATS_DIMENSIONS = {
+    'site': 'Site web',
+    'category': 'Catégorie',
+    'date': 'Date de collecte',
+}
+
+# Métriques acceptées par /stats : nom de la colonne résultat et agrégation
+STATS_METRICS = {
+    'min': ('Prix_min', ('Prix', 'min')),
+    'mean': ('Prix_moyen', ('Prix', 'mean')),
+    'max': ('Prix_max', ('Prix', 'max')),
+    'spread': ('Écart', None),  # Prix_max - Prix_min
+    'count': ('Nombre', ('Prix', 'size')),
+    'promo_count': ('Promo_Count', ('Promo', 'sum')),
+}
+
+def compute_stats(data, dimensions, metrics):
+    """
+    Calcule les métriques demandées, regroupées selon les dimensions demandées
+    (groupby vectorisé de pandas). Retourne une liste de dictionnaires.
+    """
+    columns = [STATS_DIMENSIONS[dimension] for dimension in dimensions]
+    data = data.assign(Promo=data['Discount'] != 0, _all=0)
+    if 'Date de collecte' in columns:
+        data['Date de collecte'] = data['Date de collecte'].dt.strftime('%Y-%m-%d')
+
+    aggregations = {
+        'Prix_min': ('Prix', 'min'),
+        'Prix_max': ('Prix', 'max'),
+    }
+    for metric in metrics:
+        name, aggregation = STATS_METRICS[metric]
+        if aggregation is not None:
+            aggregations[name] = aggregation
+
+    # Sans dimension, on agrège l'ensemble des données en une seule ligne
+    result = data.groupby(columns or ['_all'], dropna=False).agg(**aggregations)
+    result['Écart'] = result['Prix_max'] - result['Prix_min']
+    result = result[[STATS_METRICS[metric][0] for metric in metrics]]
+    result = result.reset_index() if columns else result.reset_index(drop=True)
+
+    # Les valeurs manquantes (NaN) sont renvoyées sous forme de null en JSON
+    result = result.astype(object).where(result.notnull(), None)
+    return result.to_dict('records')
+
+
+def parse_list_parameter(name, allowed, default):
+    """
+    Lit un paramètre GET sous forme de liste séparée par des virgules.
+    Retourne (liste, message d'erreur ou None).
+    """
+    raw = request.args.get(name, default=default, type=str)
+    values = [value.strip() for value in raw.split(',') if value.strip()]
+    invalid = [value for value in values if value not in allowed]
+    if invalid:
+        return None, f'Valeur(s) invalide(s) pour "{name}" : {", ".join(invalid)}. Valeurs possibles : {", ".join(allowed)}.'
+    # Suppression des doublons en conservant l'ordre
+    return list(dict.fromkeys(values)), None
+
+
+@app.route('/stats', methods=['GET'])
+def get_stats():
+    """
+    Statistiques agrégées sur les prix et les promotions.
+    Paramètres GET optionnels :
+      - group_by : dimensions séparées par des virgules parmi site, category, date (ex. "category,site").
+      - metrics : métriques parmi min, mean, max, spread, count, promo_count (toutes par défaut).
+    Les résultats sont mis en cache jusqu'au prochain changement du fichier de données.
+    """
+    dimensions, error = parse_list_parameter('group_by', STATS_DIMENSIONS, '')
+    if error:
+        return jsonify({'error': error}), 400
+    metrics, error = parse_list_parameter('metrics', STATS_METRICS, ','.join(STATS_METRICS))
+    if error:
+        return jsonify({'error': error}), 400
+    if not metrics:
+        return jsonify({'error': 'Le paramètre "metrics" ne peut pas être vide.'}), 400
+
+    key = (data_version, tuple(dimensions), tuple(metrics))
+    rows = stats_cache.get(key)
+    cached = rows is not None
+    if not cached:
+        rows = compute_stats(df, dimensions, metrics)
+        stats_cache.put(key, rows)
+
+    return jsonify({
+        'group_by': dimensions,
+        'metrics': metrics,
+        'data_version': data_version,
+        'cached': cached,
+        'rows': rows,
+    })
+
+
 ###########################################
 # Lancement de l'API
 ###########################################
@@ -102,4 +374,6 @@ if __name__ == '__main__':
 
 #pour tester avec un produit: http://127.0.0.1:5000/lowest_price?product=LENOVO%20V15
 #pour tester les promos : http://127.0.0.1:5000/promotions 
+#pour tester les changements : http://127.0.0.1:5000/changes?type=price_drops
+#pour tester les statistiques : http://127.0.0.1:5000/stats?group_by=category,site&metrics=mean,count,promo_count
 
@@ -5,8 +5,11 @@ from datetime import datetime
 import time
 import random
 import re
+import sys
 from urllib.parse import urlparse, parse_qs
 
+from scriptqueue import CrawlQueue, run_worker
+
 #########################################
 #   Définition du format commun         #
 #########################################
@@ -20,6 +23,10 @@ CSV_FIELDNAMES = [
     "Promotions",   # Informations sur les promotions (le cas échéant)
 ]
 
+# Délai maximum (en secondes) d'une requête HTTP. Il doit rester bien inférieur
+# à LEASE_SECONDS (scriptqueue.py) : une page doit être collectée avant l'expiration du bail.
+REQUEST_TIMEOUT = 30
+
 #########################################
 #           Scraping Jumia.ma           #
 #########################################
@@ -29,14 +36,25 @@ JUMIA_BASE_URL = "https://www.jumia.ma/ordinateurs-accessoires-informatique/"
 JUMIA_HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
 }
+JUMIA_TOTAL_PAGES = 7  # Vous pouvez mettre à jour cette valeur ou détecter dynamiquement
+
+def jumia_page_url(page):
+    """
+    Construit l'URL de la page numéro `page` du listing Jumia.
+    """
+    return f"{JUMIA_BASE_URL}?page={page}" if page > 1 else JUMIA_BASE_URL
 
-def scrape_jumia_page(url):
+def scrape_jumia_page(url, raise_errors=False):
     """
     Récupère les données des produits sur une page Jumia donnée.
     Normalise le résultat dans le format commun.
+    Si raise_errors est vrai, une réponse HTTP en erreur lève une exception
+    (utilisé par les workers de la file pour déclencher une nouvelle tentative).
     """
-    response = requests.get(url, headers=JUMIA_HEADERS)
+    response = requests.get(url, headers=JUMIA_HEADERS, timeout=REQUEST_TIMEOUT)
     if response.status_code != 200:
+        if raise_errors:
+            raise requests.HTTPError(f"HTTP {response.status_code} : {url}")
         return []
         
     soup = BeautifulSoup(response.content, 'html.parser')
@@ -78,12 +96,12 @@ def scrape_jumia():
     """
     data = []
     current_page = 1
-    total_pages = 7  # Vous pouvez mettre à jour cette valeur ou détecter dynamiquement
+    total_pages = JUMIA_TOTAL_PAGES
     
     print(f"Jumia : Détection de {total_pages} pages à scraper...")
     
     while current_page <= total_pages:
-        page_url = f"{JUMIA_BASE_URL}?page={current_page}" if current_page > 1 else JUMIA_BASE_URL
+        page_url = jumia_page_url(current_page)
         print(f"Jumia : Scraping page {current_page}/{total_pages}...")
         
         page_data = scrape_jumia_page(page_url)
@@ -100,15 +118,19 @@ def scrape_jumia():
 #           Scraping UltraPC.ma         #
 #########################################
 
-def scrape_ultrapc():
+ULTRAPC_URL = "https://www.ultrapc.ma/19-pc-portables"
+ULTRAPC_HEADERS = {"User-Agent": "Mozilla/5.0"}
+
+def scrape_ultrapc(url=ULTRAPC_URL, raise_errors=False):
     """
     Récupère les informations des produits depuis UltraPC.ma et les normalise.
+    Si raise_errors est vrai, une réponse HTTP en erreur lève une exception.
     """
-    url = "https://www.ultrapc.ma/19-pc-portables"
-    headers = {"User-Agent": "Mozilla/5.0"}
-    response = requests.get(url, headers=headers)
+    response = requests.get(url, headers=ULTRAPC_HEADERS, timeout=REQUEST_TIMEOUT)
     
     if response.status_code != 200:
+        if raise_errors:
+            raise requests.HTTPError(f"HTTP {response.status_code} : {url}")
         print("UltraPC : Échec de la récupération de la page web")
         return []
     
@@ -151,6 +173,13 @@ SETUPGAME_BASE_URL = "https://setupgame.ma/categorie-produit/pc-portable/"
 SETUPGAME_HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
 }
+SETUPGAME_MAX_PAGES = 6  # Nombre de pages à scraper
+
+def setupgame_page_url(page):
+    """
+    Construit l'URL de la page numéro `page` du listing SetupGame.
+    """
+    return SETUPGAME_BASE_URL if page == 1 else f"{SETUPGAME_BASE_URL}page/{page}/"
 
 def parse_price(price_str):
     """
@@ -170,7 +199,7 @@ def parse_price(price_str):
     except ValueError:
         return 0.0
 
-def scrape_setupgame_page(page_url):
+def scrape_setupgame_page(page_url, raise_errors=False):
     """
     Récupère les données des produits sur une page donnée de SetupGame.ma
     et les normalise dans le format commun.
@@ -178,9 +207,12 @@ def scrape_setupgame_page(page_url):
       - Si un prix de vente est disponible, le prix affiché est le prix de vente,
         et le champ Promotions contiendra le montant de la remise (prix régulier - prix de vente).
       - Sinon, le prix affiché est le prix régulier et Promotions vaut "Aucune".
+    Si raise_errors est vrai, une réponse HTTP en erreur lève une exception.
     """
-    response = requests.get(page_url, headers=SETUPGAME_HEADERS)
+    response = requests.get(page_url, headers=SETUPGAME_HEADERS, timeout=REQUEST_TIMEOUT)
     if response.status_code != 200:
+        if raise_errors:
+            raise requests.HTTPError(f"HTTP {response.status_code} : {page_url}")
         return []
         
     soup = BeautifulSoup(response.content, 'html.parser')
@@ -237,10 +269,10 @@ def scrape_setupgame():
     Scrape les produits sur plusieurs pages de SetupGame.ma et retourne les données normalisées.
     """
     data = []
-    max_pages = 6  # Nombre de pages à scraper
+    max_pages = SETUPGAME_MAX_PAGES
     
     for page in range(1, max_pages + 1):
-        page_url = SETUPGAME_BASE_URL if page == 1 else f"{SETUPGAME_BASE_URL}page/{page}/"
+        page_url = setupgame_page_url(page)
         print(f"Setup Game : Scraping page {page}...")
         page_data = scrape_setupgame_page(page_url)
         if not page_data:
@@ -254,20 +286,104 @@ def scrape_setupgame():
 #         Fonction d'export CSV         #
 #########################################
 
-def export_to_csv(all_data, filename=None):
+def export_to_csv(all_data, filename=None, mode='a'):
     """
     Exporte l'ensemble des données dans un seul fichier CSV.
     Les données doivent être au format commun défini par CSV_FIELDNAMES.
+    Par défaut les données sont ajoutées au fichier (mode 'a') ; mode='w' le remplace.
     """
     if filename is None:
         filename = f"all_products.csv"
     
-    with open(filename, 'a', newline='', encoding='utf-8') as csvfile:
+    with open(filename, mode, newline='', encoding='utf-8') as csvfile:
         writer = csv.DictWriter(csvfile, fieldnames=CSV_FIELDNAMES)
         writer.writeheader()
         writer.writerows(all_data)
     print(f"Export terminé! {len(all_data)} produits ont été enregistrés dans {filename}")
 
+#########################################
+#    Collecte distribuée (file SQLite)  #
+#########################################
+
+def list_page_jobs():
+    """
+    Retourne la liste des pages à collecter sous forme de couples (site, url).
+    Chaque couple devient un job dans la file (voir scriptqueue.py).
+    """
+    jobs = [("Jumia.ma", jumia_page_url(page)) for page in range(1, JUMIA_TOTAL_PAGES + 1)]
+    jobs.append(("UltraPC.ma", ULTRAPC_URL))
+    jobs.extend(("SetupGame.ma", setupgame_page_url(page)) for page in range(1, SETUPGAME_MAX_PAGES + 1))
+    return jobs
+
+# Fonction de scraping d'une page pour chaque site
+PAGE_SCRAPERS = {
+    "Jumia.ma": scrape_jumia_page,
+    "UltraPC.ma": scrape_ultrapc,
+    "SetupGame.ma": scrape_setupgame_page,
+}
+
+def scrape_page(site, url):
+    """
+    Collecte une seule page d'un site. Les erreurs HTTP lèvent une exception
+    afin que le job soit retenté par la file.
+    """
+    return PAGE_SCRAPERS[site](url, raise_errors=True)
+
+def enqueue_crawl(queue_filename=None, crawl_date=None):
+    """
+    Alimente la file avec les pages de tous les sites pour la date de collecte donnée.
+    Relancer la commande ne duplique pas les jobs déjà présents, mais remet en
+    attente les jobs en échec (par exemple après une panne réseau).
+    """
+    if crawl_date is None:
+        crawl_date = datetime.now().strftime("%Y-%m-%d")
+    queue = CrawlQueue(queue_filename)
+    queued = queue.enqueue_many(list_page_jobs(), crawl_date)
+    print(f"File : {queued} jobs ajoutés ou relancés pour le {crawl_date} ({queue.stats(crawl_date)})")
+    queue.close()
+
+def run_crawl_worker(queue_filename=None):
+    """
+    Lance un worker qui traite les jobs de la file jusqu'à ce qu'elle soit vide.
+    Plusieurs workers peuvent être lancés en parallèle sur le même fichier.
+    """
+    queue = CrawlQueue(queue_filename)
+    processed = run_worker(queue, scrape_page)
+    print(f"Worker terminé : {processed} jobs traités ({queue.stats()})")
+    queue.close()
+
+def export_crawl(queue_filename=None, crawl_date=None, filename=None, force=False):
+    """
+    Exporte les produits collectés par les workers pour une date de collecte
+    (aujourd'hui par défaut) dans le fichier all_products_AAAAMMJJ.csv, qui est remplacé
+    à chaque export. L'export est refusé tant que des jobs de cette date sont en attente
+    ou en cours, sauf si force est vrai. Les jobs en échec sont signalés.
+    """
+    if crawl_date is None:
+        crawl_date = datetime.now().strftime("%Y-%m-%d")
+    if filename is None:
+        filename = f"all_products_{crawl_date.replace('-', '')}.csv"
+    queue = CrawlQueue(queue_filename)
+    try:
+        counts = queue.stats(crawl_date)
+        if not queue.is_finished(crawl_date):
+            if not force:
+                print(f"Export annulé : la collecte du {crawl_date} n'est pas terminée ({counts}). "
+                      f"Utilisez --force pour exporter les résultats partiels.")
+                return
+            print(f"Attention : export partiel, la collecte du {crawl_date} n'est pas terminée ({counts})")
+
+        failed = queue.failed_jobs(crawl_date)
+        if failed:
+            print(f"Attention : {len(failed)} pages n'ont pas pu être collectées "
+                  f"(relancez 'enqueue {crawl_date}' pour les retenter) :")
+            for job in failed:
+                print(f"  - {job['site']} : {job['url']} ({job['last_error']})")
+
+        export_to_csv(queue.results(crawl_date), filename, mode='w')
+    finally:
+        queue.close()
+
 #########################################
 #       Fonction principale (main)      #
 #########################################
@@ -294,4 +410,21 @@ def main():
     export_to_csv(all_products)
 
 if __name__ == "__main__":
-    main()
+    # Usage :
+    #   python scriptcollecte.py                    -> collecte séquentielle
+    #   python scriptcollecte.py enqueue [date]     -> alimente la file de jobs (et relance les échecs)
+    #   python scriptcollecte.py worker             -> traite les jobs (lançable plusieurs fois)
+    #   python scriptcollecte.py export [date] [--force]
+    #                                               -> exporte les résultats de la file en CSV
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    options = [arg for arg in sys.argv[2:] if arg.startswith("--")]
+    arguments = [arg for arg in sys.argv[2:] if not arg.startswith("--")]
+    argument = arguments[0] if arguments else None
+    if command == "enqueue":
+        enqueue_crawl(crawl_date=argument)
+    elif command == "worker":
+        run_crawl_worker()
+    elif command == "export":
+        export_crawl(crawl_date=argument, force="--force" in options)
+    else:
+        main()
@@ -0,0 +1,161 @@
+import math
+import re
+
+#########################################
+#   Comparaison de deux collectes       #
+#########################################
+# Deux collectes (snapshots) sont jointes sur la clé (nom normalisé, site web)
+# par une jointure par hachage : la collecte précédente est indexée dans un
+# dictionnaire, puis chaque produit de la collecte courante y est recherché.
+# Le coût est donc linéaire en la taille des deux collectes.
+
+# Types de changements détectés
+PRICE_DROP = "price_drops"
+PRICE_RISE = "price_rises"
+NEW_PROMOTION = "new_promotions"
+ENDED_PROMOTION = "ended_promotions"
+APPEARED = "appeared"
+DISAPPEARED = "disappeared"
+
+CHANGE_TYPES = [PRICE_DROP, PRICE_RISE, NEW_PROMOTION, ENDED_PROMOTION, APPEARED, DISAPPEARED]
+
+
+def _is_missing(value):
+    """
+    Vrai pour une valeur absente : None, ou NaN tel que lu par pandas.
+    """
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def _value(record, field):
+    """
+    Valeur d'un champ, ou None si elle est absente (NaN n'est pas du JSON valide).
+    """
+    value = record.get(field)
+    return None if _is_missing(value) else value
+
+
+def normalize_key(record):
+    """
+    Clé de jointure d'un produit : (nom normalisé, site web).
+    Le nom, déjà uniformisé par scriptnettoyage.py, est seulement mis en minuscules
+    avec les espaces multiples réduits à un seul (ré-appliquer
+    custom_normalize_product_name tronquerait à nouveau les références).
+    """
+    name = _value(record, "Nom") or ""
+    name = re.sub(r"\s+", " ", str(name).strip()).casefold()
+    return name, _value(record, "Site web")
+
+
+def _price(record):
+    """
+    Prix numérique d'un produit, ou None s'il est absent.
+    """
+    price = _value(record, "Prix")
+    return None if price is None else float(price)
+
+
+def _has_promotion(record):
+    """
+    Une promotion est présente lorsque la valeur 'Discount' est différente de 0.
+    """
+    discount = _value(record, "Discount")
+    return discount is not None and discount != 0
+
+
+def index_snapshot(records):
+    """
+    Indexe une collecte par clé de jointure.
+    En cas de doublons sur une même clé, on garde l'enregistrement ayant le prix
+    le plus bas (même règle que remove_duplicates dans scriptnettoyage.py).
+    """
+    index = {}
+    for record in records:
+        key = normalize_key(record)
+        existing = index.get(key)
+        if existing is None:
+            index[key] = record
+            continue
+        current_price = _price(record)
+        existing_price = _price(existing)
+        if current_price is not None and (existing_price is None or current_price < existing_price):
+            index[key] = record
+    return index
+
+
+def _summary(record):
+    """
+    Champs d'un produit repris dans la description d'un changement.
+    """
+    return {
+        "Nom": _value(record, "Nom"),
+        "Site web": _value(record, "Site web"),
+        "Catégorie": _value(record, "Catégorie"),
+        "Prix": _price(record),
+        "Promotions": _value(record, "Promotions"),
+    }
+
+
+def diff_snapshots(previous, current):
+    """
+    Compare deux collectes (listes de dictionnaires avec les colonnes
+    Nom, Site web, Catégorie, Prix numérique, Discount et Promotions).
+    Retourne un dictionnaire {type de changement: liste de changements} :
+      - price_drops / price_rises : prix en baisse / en hausse,
+      - new_promotions / ended_promotions : promotion apparue / terminée,
+      - appeared / disappeared : produit nouvellement listé / retiré.
+    """
+    changes = {change_type: [] for change_type in CHANGE_TYPES}
+
+    # Phase de construction : indexation des deux collectes
+    previous_index = index_snapshot(previous)
+    current_index = index_snapshot(current)
+
+    # Phase de sondage : chaque produit courant est recherché dans la collecte précédente
+    for key, new in current_index.items():
+        old = previous_index.get(key)
+        if old is None:
+            changes[APPEARED].append(_summary(new))
+            continue
+
+        old_price = _price(old)
+        new_price = _price(new)
+        if old_price is not None and new_price is not None and old_price != new_price:
+            change = _summary(new)
+            change["Ancien prix"] = old_price
+            change["Variation"] = round(new_price - old_price, 2)
+            change["Variation (%)"] = round((new_price - old_price) / old_price * 100, 2) if old_price else None
+            changes[PRICE_DROP if new_price < old_price else PRICE_RISE].append(change)
+
+        old_promo = _has_promotion(old)
+        new_promo = _has_promotion(new)
+        if new_promo and not old_promo:
+            changes[NEW_PROMOTION].append(_summary(new))
+        elif old_promo and not new_promo:
+            change = _summary(new)
+            change["Ancienne promotion"] = _value(old, "Promotions")
+            changes[ENDED_PROMOTION].append(change)
+
+    for key, old in previous_index.items():
+        if key not in current_index:
+            changes[DISAPPEARED].append(_summary(old))
+
+    # Les plus fortes variations de prix en premier
+    changes[PRICE_DROP].sort(key=lambda change: change["Variation"])
+    changes[PRICE_RISE].sort(key=lambda change: change["Variation"], reverse=True)
+    return changes
+
+
+def split_snapshots(records, date_field="Date de collecte"):
+    """
+    Répartit des enregistrements par date de collecte.
+    Retourne un dictionnaire {date: liste d'enregistrements}, trié par date.
+    """
+    snapshots = {}
+    for record in records:
+        date = _value(record, date_field)
+        if date is None:
+            continue
+        snapshots.setdefault(date, []).append(record)
+    return dict(sorted(snapshots.items()))
+
@@ -0,0 +1,335 @@
+import json
+import os
+import random
+import socket
+import sqlite3
+import time
+import uuid
+
+#########################################
+#   File de travail durable (SQLite)    #
+#########################################
+# Chaque URL de page à scraper devient un "job" dans une base SQLite locale.
+# Plusieurs processus (éventuellement sur plusieurs machines partageant le
+# fichier) peuvent réclamer des jobs grâce à un bail (lease) à durée limitée.
+# Un job dont le bail expire (worker tombé en panne) redevient disponible,
+# ce qui permet de reprendre une collecte là où elle s'est arrêtée.
+
+QUEUE_FILENAME = "crawl_queue.db"
+# Durée d'un bail avant qu'un job puisse être repris. Le scraping d'une page doit
+# se terminer dans ce délai : passé ce délai, le job peut être réclamé par un autre
+# worker et les résultats du premier sont ignorés.
+# Les échéances des baux sont calculées avec l'horloge de chaque machine : lorsque
+# plusieurs machines partagent le fichier, leurs horloges doivent être synchronisées
+# (NTP), sinon un bail actif peut être repris trop tôt ou un bail abandonné trop tard.
+LEASE_SECONDS = 120
+MAX_ATTEMPTS = 3        # Nombre maximum de tentatives par job
+RETRY_DELAY_SECONDS = 30  # Délai avant une nouvelle tentative, doublé à chaque échec
+
+# Statuts possibles d'un job
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id        TEXT PRIMARY KEY,      -- date|site|url (voir make_job_id)
+    site          TEXT NOT NULL,
+    url           TEXT NOT NULL,
+    crawl_date    TEXT NOT NULL,         -- Date de collecte (YYYY-MM-DD)
+    sequence      INTEGER NOT NULL,      -- Rang du job dans la liste des pages à collecter
+    status        TEXT NOT NULL,
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    lease_owner   TEXT,
+    lease_token   TEXT,
+    lease_expires REAL,
+    not_before    REAL,                  -- Le job ne peut pas être réclamé avant cette date
+    last_error    TEXT,
+    updated_at    REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, lease_expires);
+
+CREATE TABLE IF NOT EXISTS results (
+    job_id   TEXT NOT NULL,
+    position INTEGER NOT NULL,           -- Rang du produit dans la page
+    data     TEXT NOT NULL,              -- Enregistrement au format commun (JSON)
+    PRIMARY KEY (job_id, position)
+);
+"""
+
+
+def make_job_id(site, url, crawl_date):
+    """
+    Construit l'identifiant d'un job : un même couple (site, URL) n'est
+    collecté qu'une seule fois par date de collecte.
+    """
+    return f"{crawl_date}|{site}|{url}"
+
+
+def default_worker_id():
+    """
+    Identifiant du worker courant : nom de machine + PID.
+    """
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class CrawlQueue:
+    """
+    File de jobs de scraping stockée dans un fichier SQLite.
+
+    Cycle de vie d'un job :
+      pending --claim()--> running --complete()--> done
+                              |
+                              +--fail()--> pending (nouvelle tentative) ou failed
+    Un job "running" dont le bail a expiré peut être réclamé à nouveau.
+    """
+
+    def __init__(self, filename=None, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS,
+                 retry_delay=RETRY_DELAY_SECONDS):
+        if filename is None:
+            filename = QUEUE_FILENAME
+        self.filename = filename
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        # isolation_level=None : les transactions sont gérées explicitement (BEGIN IMMEDIATE)
+        self.conn = sqlite3.connect(filename, timeout=30, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def _transaction(self):
+        """
+        Ouvre une transaction en écriture : le verrou est pris immédiatement,
+        ce qui empêche deux workers de réclamer le même job.
+        """
+        self.conn.execute("BEGIN IMMEDIATE")
+
+    # --- Alimentation de la file ---
+
+    def enqueue(self, site, url, crawl_date, sequence=0):
+        """
+        Ajoute un job s'il n'existe pas déjà. Un job existant en échec est remis en
+        attente avec un nouveau quota de tentatives ; les autres jobs existants sont
+        laissés tels quels (ré-exécuter l'alimentation ne duplique rien).
+        `sequence` fixe l'ordre des jobs (et donc des résultats exportés).
+        Retourne True si le job a été créé ou relancé.
+        """
+        now = time.time()
+        job_id = make_job_id(site, url, crawl_date)
+        cursor = self.conn.execute(
+            "INSERT OR IGNORE INTO jobs (job_id, site, url, crawl_date, sequence, status, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job_id, site, url, crawl_date, sequence, STATUS_PENDING, now),
+        )
+        if cursor.rowcount == 1:
+            return True
+        cursor = self.conn.execute(
+            "UPDATE jobs SET status = ?, attempts = 0, not_before = NULL, last_error = NULL, "
+            "updated_at = ? WHERE job_id = ? AND status = ?",
+            (STATUS_PENDING, now, job_id, STATUS_FAILED),
+        )
+        return cursor.rowcount == 1
+
+    def enqueue_many(self, jobs, crawl_date):
+        """
+        Ajoute une liste de jobs (site, url) en une seule transaction,
+        en conservant l'ordre de la liste.
+        Retourne le nombre de jobs créés ou relancés.
+        """
+        created = 0
+        self._transaction()
+        try:
+            for sequence, (site, url) in enumerate(jobs):
+                if self.enqueue(site, url, crawl_date, sequence):
+                    created += 1
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return created
+
+    # --- Consommation par les workers ---
+
+    def claim(self, worker_id):
+        """
+        Réclame un job disponible (en attente et dont le délai avant nouvelle tentative
+        est écoulé, ou en cours avec un bail expiré).
+        Retourne un dictionnaire décrivant le job (dont 'lease_token'), ou None
+        si aucun job n'est disponible.
+        """
+        now = time.time()
+        self._transaction()
+        try:
+            row = self.conn.execute(
+                "SELECT * FROM jobs "
+                "WHERE ((status = ? AND (not_before IS NULL OR not_before <= ?)) "
+                "       OR (status = ? AND lease_expires < ?)) AND attempts < ? "
+                "ORDER BY attempts, crawl_date, sequence LIMIT 1",
+                (STATUS_PENDING, now, STATUS_RUNNING, now, self.max_attempts),
+            ).fetchone()
+            if row is None:
+                # Les jobs dont le bail a expiré après la dernière tentative sont abandonnés
+                self.conn.execute(
+                    "UPDATE jobs SET status = ?, last_error = ?, updated_at = ? "
+                    "WHERE status = ? AND lease_expires < ? AND attempts >= ?",
+                    (STATUS_FAILED, "Bail expiré", now, STATUS_RUNNING, now, self.max_attempts),
+                )
+                self.conn.execute("COMMIT")
+                return None
+
+            token = uuid.uuid4().hex
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_owner = ?, "
+                "lease_token = ?, lease_expires = ?, updated_at = ? WHERE job_id = ?",
+                (STATUS_RUNNING, worker_id, token, now + self.lease_seconds, now, row["job_id"]),
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+        job = dict(row)
+        job["attempts"] += 1
+        job["lease_token"] = token
+        return job
+
+    def complete(self, job, records):
+        """
+        Enregistre les produits collectés et marque le job comme terminé.
+        L'écriture est idempotente : les résultats précédents du job sont remplacés,
+        et rien n'est écrit si le bail a été repris par un autre worker.
+        Retourne True si les résultats ont été enregistrés.
+        """
+        now = time.time()
+        self._transaction()
+        try:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET status = ?, lease_owner = NULL, lease_token = NULL, "
+                "lease_expires = NULL, last_error = NULL, updated_at = ? "
+                "WHERE job_id = ? AND status = ? AND lease_token = ?",
+                (STATUS_DONE, now, job["job_id"], STATUS_RUNNING, job["lease_token"]),
+            )
+            if cursor.rowcount != 1:
+                self.conn.execute("ROLLBACK")
+                return False
+            self.conn.execute("DELETE FROM results WHERE job_id = ?", (job["job_id"],))
+            self.conn.executemany(
+                "INSERT INTO results (job_id, position, data) VALUES (?, ?, ?)",
+                [(job["job_id"], position, json.dumps(record, ensure_ascii=False))
+                 for position, record in enumerate(records)],
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return True
+
+    def fail(self, job, error):
+        """
+        Signale l'échec d'un job : il est remis en attente tant qu'il reste
+        des tentatives, après un délai qui double à chaque échec (retry_delay,
+        2 x retry_delay, ...), sinon il passe au statut "failed".
+        """
+        now = time.time()
+        status = STATUS_PENDING if job["attempts"] < self.max_attempts else STATUS_FAILED
+        not_before = now + self.retry_delay * 2 ** (job["attempts"] - 1)
+        cursor = self.conn.execute(
+            "UPDATE jobs SET status = ?, lease_owner = NULL, lease_token = NULL, "
+            "lease_expires = NULL, not_before = ?, last_error = ?, updated_at = ? "
+            "WHERE job_id = ? AND status = ? AND lease_token = ?",
+            (status, not_before, str(error), now, job["job_id"], STATUS_RUNNING, job["lease_token"]),
+        )
+        return cursor.rowcount == 1
+
+    # --- Suivi et export ---
+
+    def stats(self, crawl_date=None):
+        """
+        Retourne le nombre de jobs par statut (pour une date de collecte, ou pour toutes).
+        """
+        query = "SELECT status, COUNT(*) AS n FROM jobs"
+        params = []
+        if crawl_date is not None:
+            query += " WHERE crawl_date = ?"
+            params.append(crawl_date)
+        query += " GROUP BY status"
+        counts = {STATUS_PENDING: 0, STATUS_RUNNING: 0, STATUS_DONE: 0, STATUS_FAILED: 0}
+        for row in self.conn.execute(query, params):
+            counts[row["status"]] = row["n"]
+        return counts
+
+    def is_finished(self, crawl_date=None):
+        """
+        Vrai lorsqu'il ne reste plus aucun job en attente ou en cours.
+        """
+        counts = self.stats(crawl_date)
+        return counts[STATUS_PENDING] == 0 and counts[STATUS_RUNNING] == 0
+
+    def failed_jobs(self, crawl_date=None):
+        """
+        Retourne les jobs abandonnés après avoir épuisé leurs tentatives.
+        """
+        query = "SELECT * FROM jobs WHERE status = ?"
+        params = [STATUS_FAILED]
+        if crawl_date is not None:
+            query += " AND crawl_date = ?"
+            params.append(crawl_date)
+        query += " ORDER BY crawl_date, sequence"
+        return [dict(row) for row in self.conn.execute(query, params)]
+
+    def results(self, crawl_date=None):
+        """
+        Retourne les produits collectés (au format commun), dans l'ordre des jobs
+        puis des produits dans chaque page.
+        """
+        query = ("SELECT r.data FROM results r JOIN jobs j ON j.job_id = r.job_id "
+                 "WHERE j.status = ?")
+        params = [STATUS_DONE]
+        if crawl_date is not None:
+            query += " AND j.crawl_date = ?"
+            params.append(crawl_date)
+        query += " ORDER BY j.crawl_date, j.sequence, r.position"
+        return [json.loads(row["data"]) for row in self.conn.execute(query, params)]
+
+
+def run_worker(queue, scrape_page, worker_id=None, poll_interval=5, pause=(1, 3)):
+    """
+    Boucle d'un worker : réclame des jobs et les exécute jusqu'à ce que la file soit vide.
+    - scrape_page(site, url) doit retourner la liste des produits de la page,
+      en moins de LEASE_SECONDS (le bail n'est pas prolongé pendant le scraping).
+    - Lorsque d'autres workers ont encore des jobs en cours, ou que des jobs attendent
+      leur délai avant nouvelle tentative, on attend poll_interval secondes.
+    Retourne le nombre de jobs traités par ce worker.
+    """
+    if worker_id is None:
+        worker_id = default_worker_id()
+    processed = 0
+
+    while True:
+        job = queue.claim(worker_id)
+        if job is None:
+            if queue.is_finished():
+                break
+            time.sleep(poll_interval)
+            continue
+
+        print(f"[{worker_id}] {job['site']} : {job['url']} (tentative {job['attempts']})")
+        try:
+            records = scrape_page(job["site"], job["url"])
+            # La date de collecte est celle du job, même si la collecte reprend un autre jour
+            for record in records:
+                record["Date de collecte"] = job["crawl_date"]
+        except Exception as e:
+            print(f"[{worker_id}] Échec : {e}")
+            queue.fail(job, e)
+        else:
+            if not queue.complete(job, records):
+                print(f"[{worker_id}] Bail perdu, résultats ignorés pour {job['url']}")
+        processed += 1
+        time.sleep(random.uniform(*pause))  # Pause entre les requêtes
+
+    return processed